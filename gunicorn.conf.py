@@ -0,0 +1,19 @@
+# Production server config, used by running `gunicorn` from the repo root.
+import multiprocessing
+from pathlib import Path
+
+chdir = str(Path(__file__).parent / 'src')
+wsgi_app = 'app:app'
+bind = '127.0.0.1:5000'
+
+# One worker per core. --preload imports the app (numpy, ezdxf, numba...) once in the master, so
+# the forked workers share those pages copy-on-write. Each worker keeps its own slicing pool,
+# sized to one process so that the workers together use one process per core.
+workers = multiprocessing.cpu_count()
+preload_app = True
+raw_env = ['SLICE_WORKERS=1']
+
+# Threads so that progress streams (server-sent events) don't each hold up a whole worker
+worker_class = 'gthread'
+threads = 4
+timeout = 300
@@ -0,0 +1,81 @@
+# cython: language_level=3
+"""
+Cython build of the hatching kernel (see _hatch in slice.py), used by slice.py when it has been compiled.
+
+Build it in place with:
+    cythonize -3 --inplace src/_hatch.pyx
+"""
+cimport cython
+from libc.math cimport fabs
+import numpy as np
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+@cython.cdivision(True)
+def hatch(const double[::1] P1x, const double[::1] P1y, const double[::1] P2x, const double[::1] P2y,
+          double A, double B, const double[::1] c_values, double epsilon):
+    """
+    Intersects every hatch line A*x + B*y = c with the polygon edges and pairs up the intersections.
+
+    Returns:
+      A (K, 4) array of segments (x_start, y_start, x_end, y_end) in the same order as
+      get_hatch_segments in slice.py.
+    """
+    cdef Py_ssize_t n = P1x.shape[0]
+    cdef Py_ssize_t m = c_values.shape[0]
+    cdef Py_ssize_t i, j, k, pos
+    cdef Py_ssize_t total = 0, count = 0
+    cdef double t, x, y
+
+    dx_arr = np.empty(n)
+    dy_arr = np.empty(n)
+    denom_arr = np.empty(n)
+    cdef double[::1] dx = dx_arr
+    cdef double[::1] dy = dy_arr
+    cdef double[::1] denom = denom_arr
+    for i in range(n):
+        dx[i] = P2x[i] - P1x[i]
+        dy[i] = P2y[i] - P1y[i]
+        denom[i] = A * dx[i] + B * dy[i]
+
+    # First pass: count intersections to size the output buffer.
+    for j in range(m):
+        for i in range(n):
+            if fabs(denom[i]) < epsilon:
+                continue  # edge is parallel to the line
+            t = -(A * P1x[i] + B * P1y[i] - c_values[j]) / denom[i]
+            if 0 <= t <= 1:
+                total += 1
+
+    out_arr = np.empty((total // 2, 4))
+    xs_arr = np.empty(n)
+    ys_arr = np.empty(n)
+    cdef double[:, ::1] out = out_arr
+    cdef double[::1] xs = xs_arr
+    cdef double[::1] ys = ys_arr
+    for j in range(m):
+        k = 0
+        for i in range(n):
+            if fabs(denom[i]) < epsilon:
+                continue
+            t = -(A * P1x[i] + B * P1y[i] - c_values[j]) / denom[i]
+            if 0 <= t <= 1:
+                # Insertion sort by x as we go (stable, N is small).
+                x = P1x[i] + t * dx[i]
+                y = P1y[i] + t * dy[i]
+                pos = k
+                while pos > 0 and xs[pos - 1] > x:
+                    xs[pos] = xs[pos - 1]
+                    ys[pos] = ys[pos - 1]
+                    pos -= 1
+                xs[pos] = x
+                ys[pos] = y
+                k += 1
+        for i in range(0, k - 1, 2):
+            out[count, 0] = xs[i]
+            out[count, 1] = ys[i]
+            out[count, 2] = xs[i + 1]
+            out[count, 3] = ys[i + 1]
+            count += 1
+    return out_arr[:count]
@@ -1,24 +1,246 @@
-from flask import Flask, request, render_template, send_file, session
+from flask import Flask, request, render_template, send_from_directory, session, jsonify, Response, abort
+from werkzeug.utils import secure_filename
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import threading
+import tempfile
+import hashlib
+import time
+import json
 import io
+import os
 from pathlib import Path
-from slice import slice_dxf  # Import your slicing function directly
+from slice import generate_slice_path, convert_to_gcode, serialize_visualization, SLICER_VERSION
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'  # Required for session management
+app.config['MAX_CONTENT_LENGTH'] = 64 * 1024 * 1024  # Largest accepted upload (64 MiB)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Stream uploads to disk 1 MiB at a time
 
 BASE_DIR = Path(__file__).parent
 UPLOAD_FOLDER = BASE_DIR / 'uploads'
 UPLOAD_FOLDER.mkdir(exist_ok=True)
 
-VISUALIZATION_FOLDER = BASE_DIR / 'static' / 'images'
-VISUALIZATION_FOLDER.mkdir(parents=True, exist_ok=True)
-
 TEMP_FOLDER = BASE_DIR / 'temp'
 TEMP_FOLDER.mkdir(exist_ok=True)
 
+# Slice results (G-code and visualization data) keyed by "v<slicer version>_<sha256 of the DXF>_<spacing>"
+CACHE_FOLDER = TEMP_FOLDER / 'cache'
+CACHE_FOLDER.mkdir(exist_ok=True)
+CACHE_MAX_BYTES = 256 * 1024 * 1024  # Shared by the slice results and the uploads they are sliced from
+CACHE_MAX_AGE = 365 * 24 * 60 * 60  # Cached files are named by content, so browsers may keep them
+
+# Slicing runs in worker processes (matplotlib and ezdxf hold the GIL) so requests return right away.
+# Job state lives in the cache folder rather than in memory, so that any server process
+# (e.g. any gunicorn worker) can report on a job started by another one.
+SLICE_WORKERS = int(os.environ.get('SLICE_WORKERS', os.cpu_count()))
+JOB_TIMEOUT = 300  # Seconds without progress after which a job is considered lost
+JOB_HEARTBEAT_INTERVAL = 10  # Unfinished jobs' progress files are touched this often, so long waits aren't lost
+PROGRESS_POLL_INTERVAL = 0.25
+
+_executor = None
+_executor_lock = threading.Lock()
+_heartbeat = None
+_unfinished_jobs = set()  # Keys of the jobs this process submitted that are queued or running
+
+def heartbeat():
+    """
+    Keeps the progress files of this process's unfinished jobs fresh, whether they are still
+    waiting in the pool's queue or running, so they are only considered lost if this process dies.
+    """
+    while True:
+        time.sleep(JOB_HEARTBEAT_INTERVAL)
+        with _executor_lock:
+            keys = list(_unfinished_jobs)
+        for key in keys:
+            progress_path, _ = job_paths(key)
+            try:
+                os.utime(progress_path)
+            except FileNotFoundError:
+                pass  # Finished, or replaced by write_atomic at that moment
+
+def get_executor():
+    """
+    Returns this process's slicing pool, created on first use so that it is never shared across
+    a fork (gunicorn --preload imports the app before forking its workers).
+    """
+    global _executor, _heartbeat
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=SLICE_WORKERS)
+        if _heartbeat is None:
+            _heartbeat = threading.Thread(target=heartbeat, daemon=True)
+            _heartbeat.start()
+        return _executor
+
+def replace_broken_executor(executor):
+    """
+    Drops a pool that can no longer run jobs (e.g. a slicing process was killed for running out
+    of memory), so the next get_executor() starts a new one.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+def upload_path(file_hash):
+    """
+    Returns the path an uploaded DXF is stored under. Uploads are named by content, so the file
+    sliced for a cache key is always the one the key was computed from.
+    """
+    return UPLOAD_FOLDER / f'{file_hash}.dxf'
+
+def save_upload(stream):
+    """
+    Streams an uploaded DXF into the upload folder, hashing it on the way, and returns its sha256.
+    """
+    digest = hashlib.sha256()  # Hash while streaming so the file isn't read twice
+    # A unique temporary file, so concurrent uploads don't write over each other
+    part_file = tempfile.NamedTemporaryFile(dir=UPLOAD_FOLDER, suffix='.part', delete=False)
+    part_path = Path(part_file.name)
+    try:
+        with part_file as f:
+            while chunk := stream.read(UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+        file_path = upload_path(digest.hexdigest())
+        if file_path.exists():
+            os.utime(file_path)  # Mark as recently used
+        else:
+            os.replace(part_path, file_path)  # Atomic, so readers never see a partial file
+    finally:
+        part_path.unlink(missing_ok=True)
+
+    evict_cache()
+    return digest.hexdigest()
+
+def cache_key(file_hash, spacing):
+    return f'v{SLICER_VERSION}_{file_hash}_{spacing}'
+
+def cache_paths(key):
+    """
+    Returns the (gcode_path, viz_path) a slice result is cached under.
+    """
+    return CACHE_FOLDER / f'{key}.gcode', CACHE_FOLDER / f'{key}.json'
+
+def job_paths(key):
+    """
+    Returns the (progress_path, error_path) holding the state of the slice job for key.
+    """
+    return CACHE_FOLDER / f'{key}.progress', CACHE_FOLDER / f'{key}.error'
+
+def write_atomic(path, text):
+    """
+    Writes text to path via a temporary file, so readers never see a partial file.
+    """
+    tmp_path = path.with_name(f'{path.name}.{os.getpid()}.tmp')
+    tmp_path.write_text(text)
+    os.replace(tmp_path, path)
+
+def evict_cache(max_bytes=CACHE_MAX_BYTES):
+    """
+    Deletes the least recently used cached results and uploads until together they fit in max_bytes.
+    The uploads of running jobs and files still being written are kept.
+    """
+    running = [path for path in CACHE_FOLDER.glob('*.progress') if job_running(path.stem)]
+    keep = {*running, *(upload_path(path.stem.split('_')[1]) for path in running)}
+
+    entries = []
+    for path in (*CACHE_FOLDER.iterdir(), *UPLOAD_FOLDER.iterdir()):
+        if path in keep or path.suffix in ('.part', '.tmp'):
+            continue
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue  # Evicted by another worker
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+def run_slice_job(file_path, spacing, key):
+    """
+    Slices the DXF in a worker process and stores the G-code and visualization data in the cache.
+    """
+    progress_path, _ = job_paths(key)
+
+    def progress(stage, pct):
+        write_atomic(progress_path, json.dumps({'stage': stage, 'pct': pct}))
+
+    cmd_arr = generate_slice_path(file_path, spacing, progress)
+    gcode_content = "\n".join(convert_to_gcode(cmd_arr))
+    progress('gcode', 80)
+    viz = serialize_visualization(cmd_arr)
+
+    # The G-code is written last: once it exists the result is complete
+    gcode_file_path, viz_path = cache_paths(key)
+    write_atomic(viz_path, json.dumps(viz))
+    write_atomic(gcode_file_path, gcode_content)
+    progress_path.unlink(missing_ok=True)
+
+    evict_cache()
+
+def job_running(key):
+    """
+    Returns whether the slice job for key is queued or running, i.e. its progress file was written
+    or kept alive by heartbeat() within JOB_TIMEOUT.
+    """
+    progress_path, _ = job_paths(key)
+    try:
+        return time.time() - progress_path.stat().st_mtime < JOB_TIMEOUT
+    except FileNotFoundError:
+        return False
+
+def submit_slice_job(file_path, spacing, key):
+    """
+    Queues a slice of the uploaded DXF, unless the same slice is already running.
+    """
+    if job_running(key):
+        return
+
+    progress_path, error_path = job_paths(key)
+    error_path.unlink(missing_ok=True)
+    write_atomic(progress_path, json.dumps({'stage': 'queued', 'pct': 0}))
+
+    def record_error(future):
+        with _executor_lock:
+            _unfinished_jobs.discard(key)
+        if future.exception() is not None:
+            write_atomic(error_path, str(future.exception()))
+            progress_path.unlink(missing_ok=True)
+
+    with _executor_lock:
+        _unfinished_jobs.add(key)
+    try:
+        try:
+            executor = get_executor()
+            future = executor.submit(run_slice_job, str(file_path), int(spacing), key)
+        except BrokenProcessPool:
+            replace_broken_executor(executor)
+            future = get_executor().submit(run_slice_job, str(file_path), int(spacing), key)
+    except BaseException:
+        with _executor_lock:
+            _unfinished_jobs.discard(key)
+        progress_path.unlink(missing_ok=True)  # Never queued, so don't report it as running
+        raise
+    future.add_done_callback(record_error)
+
+def render_result(gcode_content, filename, spacing, key, viz=True):
+    return render_template('index.html',
+                           output=gcode_content,
+                           viz_url=f"/cache/{key}.json" if viz else None,
+                           filename=filename.replace('.dxf', '.gcode'),
+                           cache_key=key if viz else None,  # Failed jobs have no G-code to download
+                           saved_spacing=spacing)  # Pass spacing to keep the value persistent
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    gcode_content = None
     filename = session.get('filename')  # Load filename from session
     spacing = request.form.get('spacing', '10')  # Default spacing
 
@@ -27,50 +249,128 @@ def index():
 
         # Handle new file upload or reuse the previous file
         if file and file.filename.endswith('.dxf'):
-            file_path = UPLOAD_FOLDER / file.filename
-            file.save(str(file_path))
-            session['filename'] = file.filename  # Store filename in session
-        elif filename:
-            file_path = UPLOAD_FOLDER / filename  # Use existing file if no new file uploaded
-        else:
-            return render_template('index.html', output=None, image_url=None, filename=None)
-
-        output_image_path = VISUALIZATION_FOLDER / 'visualization.png'
+            filename = secure_filename(file.filename)
+            session['filename'] = filename  # Store filename in session
+            session['file_hash'] = save_upload(file.stream)
+        elif not (filename and session.get('file_hash')):
+            return render_template('index.html', output=None, viz_url=None, filename=None)
+        file_path = upload_path(session['file_hash'])  # Reuses the previous file if no new file uploaded
 
         try:
-            # Pass spacing to slice_dxf
-            gcode_content = slice_dxf(str(file_path), output_image_path=str(output_image_path), spacing=int(spacing))
-            filename = filename.replace('.dxf', '.gcode')
+            spacing = int(spacing)
+            if spacing < 1:
+                raise ValueError(f"spacing must be at least 1 mm, got {spacing}")
+        except ValueError as e:
+            return render_template('index.html',
+                                   output=f"Error running script: {str(e)}",
+                                   viz_url=None,
+                                   filename=filename,
+                                   saved_spacing=spacing)
 
-            # Save G-code content to a temporary file
-            gcode_file_path = TEMP_FOLDER / filename
-            with open(gcode_file_path, 'w') as f:
-                f.write(gcode_content)
+        # Reuse the cached result if this file has already been sliced with this spacing
+        key = cache_key(session['file_hash'], spacing)
+        gcode_file_path, viz_path = cache_paths(key)
+        if gcode_file_path.exists() and viz_path.exists():
+            for path in (gcode_file_path, viz_path):
+                os.utime(path)  # Mark as recently used
+            return render_result(gcode_file_path.read_text(), filename, spacing, key)
 
-        except Exception as e:
-            gcode_content = f"Error running script: {str(e)}"
+        if not file_path.exists():  # Evicted since it was uploaded
+            return render_template('index.html',
+                                   output="Error running script: the uploaded file has expired, please upload it again",
+                                   viz_url=None,
+                                   filename=filename,
+                                   saved_spacing=spacing)
 
+        submit_slice_job(file_path, spacing, key)
         return render_template('index.html',
-                               output=gcode_content,
-                               image_url=f"/static/images/visualization.png",
+                               output=None,
+                               viz_url=None,
                                filename=filename,
+                               job_id=key,
                                saved_spacing=spacing)  # Pass spacing to keep the value persistent
 
-    return render_template('index.html', output=None, image_url=None, filename=None, saved_spacing='10')
-
-@app.route('/download')
-def download_file():
-    filename = request.args.get('filename')
-    file_path = TEMP_FOLDER / filename
-
-    if file_path.exists():
-        return send_file(
-            file_path,
-            mimetype='text/plain',
-            as_attachment=True,
-            download_name=filename
-        )
-    return "No G-code available", 404
+    return render_template('index.html', output=None, viz_url=None, filename=None, saved_spacing='10')
+
+@app.route('/progress/<key>')
+def progress(key):
+    """
+    Server-sent events with the progress of a slice job, ending with a 'done' event.
+    A job that stops reporting progress (e.g. its worker was restarted) is recorded as failed.
+    """
+    key = secure_filename(key)
+    gcode_file_path, _ = cache_paths(key)
+    progress_path, error_path = job_paths(key)
+    if not (gcode_file_path.exists() or progress_path.exists() or error_path.exists()):
+        abort(404)
+
+    def events():
+        last_message = None
+        while not (gcode_file_path.exists() or error_path.exists()):
+            if not job_running(key):
+                if not (gcode_file_path.exists() or error_path.exists()):  # Lost, rather than just finished
+                    error = "Slice job was lost before it finished, please submit it again"
+                    write_atomic(error_path, error)
+                    progress_path.unlink(missing_ok=True)
+                    yield f"data: {json.dumps({'pct': 100, 'done': True, 'error': error})}\n\n"
+                    return
+                break
+            try:
+                message = progress_path.read_text()
+            except FileNotFoundError:
+                continue  # Finished or failed between the checks
+            if message != last_message:
+                yield f"data: {message}\n\n"
+                last_message = message
+            time.sleep(PROGRESS_POLL_INTERVAL)
+        yield f"data: {json.dumps({'pct': 100, 'done': True})}\n\n"
+
+    return Response(events(), mimetype='text/event-stream')
+
+@app.route('/result/<key>')
+def result(key):
+    key = secure_filename(key)
+    filename = request.args.get('filename', '')
+    spacing = key.rsplit('_', 1)[-1]
+    gcode_file_path, _ = cache_paths(key)
+    _, error_path = job_paths(key)
+
+    if gcode_file_path.exists():
+        return render_result(gcode_file_path.read_text(), filename, spacing, key)
+    if error_path.exists():
+        return render_result(f"Error running script: {error_path.read_text()}", filename, spacing, key, viz=False)
+    abort(404)
+
+@app.route('/upload', methods=['POST'])
+def upload_file():
+    """
+    Streams a raw DXF request body straight to the upload folder, skipping multipart parsing.
+    The filename (used for the download name) is given in the X-Filename header.
+    """
+    filename = secure_filename(request.headers.get('X-Filename', ''))
+    if not filename.endswith('.dxf'):
+        return "Expected a .dxf file", 400
+
+    session['filename'] = filename  # Store filename in session
+    session['file_hash'] = save_upload(request.stream)
+    return jsonify(filename=filename)
+
+@app.route('/cache/<name>')
+def cached_file(name):
+    """
+    Serves a cached slice result. The names are content-addressed, so they can be cached forever.
+    With ?download=<filename> the file is sent as an attachment under that name.
+    """
+    if Path(name).suffix not in ('.gcode', '.json'):
+        abort(404)  # Job state and temporary files change, so they must not be served as immutable
+    download_name = request.args.get('download')
+    response = send_from_directory(CACHE_FOLDER, name,
+                                   as_attachment=bool(download_name),
+                                   download_name=download_name,
+                                   max_age=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 if __name__ == '__main__':
@@ -1,32 +1,98 @@
 import serial
 import time
 import re
-import math
+import struct
+from collections import deque
 
 # Configuration
 SERIAL_PORT = '/dev/tty.usbmodem1101'  # Replace with your Arduino's port
 BAUD_RATE = 115200  # Must match the baud rate in your Arduino code
 GCODE_FILE = "temp/ugly.gcode"
+RX_BUFFER_SIZE = 64  # Arduino (AVR) serial receive buffer size in bytes
+BINARY_MODE = True  # Send moves as packed binary records instead of G-code text
+ACK_TIMEOUT = 30  # Seconds of silence from the controller before giving up on an "ok"
+
+# Binary move records, must match the decoder in stepper-controller.ino:
+# flags, then x and y in steps (hundredths of a mm) as little-endian int32
+BINARY_RECORD = struct.Struct('<Bii')
+BINARY_FLAG_EXTRUDE = 0x01
+BINARY_FLAG_END = 0x80
+STEPS_PER_MM = 100
+
+# Matches every X/Y/Z word in a G-code line in a single scan
+COORD_PATTERN = re.compile(r'([XYZ])([-+]?[0-9]*\.?[0-9]+)')
 
 # Extract X, Y, Z coordinates from G-code lines
 def extract_coordinates(line):
-    match_x = re.search(r'X([-+]?[0-9]*\.?[0-9]+)', line)
-    match_y = re.search(r'Y([-+]?[0-9]*\.?[0-9]+)', line)
-    match_z = re.search(r'Z([-+]?[0-9]*\.?[0-9]+)', line)
+    coords = {}
+    for axis, value in COORD_PATTERN.findall(line):
+        coords.setdefault(axis, value)  # First occurrence wins, like re.search
 
-    x = float(match_x.group(1)) if match_x else None
-    y = float(match_y.group(1)) if match_y else None
-    z = float(match_z.group(1)) if match_z else None
+    x = float(coords['X']) if 'X' in coords else None
+    y = float(coords['Y']) if 'Y' in coords else None
+    z = float(coords['Z']) if 'Z' in coords else None
     return x, y, z
 
-# Calculate Euclidean distance
-def calculate_distance(p1, p2):
-    x1, y1, z1 = p1
-    x2, y2, z2 = p2
-    dx = (x2 - x1) if x1 is not None and x2 is not None else 0
-    dy = (y2 - y1) if y1 is not None and y2 is not None else 0
-    dz = (z2 - z1) if z1 is not None and z2 is not None else 0
-    return math.sqrt(dx**2 + dy**2 + dz**2)
+# Convert G-code lines into (x, y, state) commands, where state 1 means the move extrudes
+def gcode_to_cmds(gcode_lines):
+    cmds = []
+    x, y = 0.0, 0.0
+    for line in gcode_lines:
+        if not line.startswith('G1'):
+            continue
+        new_x, new_y, _ = extract_coordinates(line)
+        x = new_x if new_x is not None else x
+        y = new_y if new_y is not None else y
+        cmds.append((x, y, 1 if 'E' in line else 0))
+    return cmds
+
+# Pack (x, y, state) commands into binary move records, ending with an end-of-stream record
+def pack_gcode_binary(cmds):
+    records = [BINARY_RECORD.pack(BINARY_FLAG_EXTRUDE if e else 0,
+                                  round(x * STEPS_PER_MM), round(y * STEPS_PER_MM))
+               for x, y, e in cmds]
+    records.append(BINARY_RECORD.pack(BINARY_FLAG_END, 0, 0))
+    return records
+
+# Wait for the controller to acknowledge the oldest unacknowledged message
+def wait_for_ok(ser, pending):
+    deadline = time.monotonic() + ACK_TIMEOUT
+    while True:
+        response = ser.readline().decode('utf-8', errors='replace').strip()
+        if response == 'ok':
+            return pending.popleft()
+        if response:
+            print(f"Controller: {response}")
+            deadline = time.monotonic() + ACK_TIMEOUT  # Still talking, just busy
+        elif time.monotonic() > deadline:
+            raise serial.SerialTimeoutException(
+                f"No 'ok' from the controller for {ACK_TIMEOUT} s. Check the port, that the board "
+                f"hasn't reset, and that its firmware supports {'BINARY mode' if BINARY_MODE else 'ok replies'}")
+
+# Character-counting streaming: keep the controller's receive buffer as full as possible
+# and free up space as each message is acknowledged with "ok".
+# Messages that fit in the buffer together are sent in a single write.
+def stream(ser, messages):
+    pending = deque()  # Byte counts of messages sent but not yet acknowledged
+    buffered = 0
+    batch = b''
+    for data in messages:
+        # Strictly less: the AVR ring buffer keeps one of its slots empty, so it holds one byte fewer
+        while pending and buffered + len(data) >= RX_BUFFER_SIZE:
+            if batch:
+                ser.write(batch)
+                batch = b''
+            buffered -= wait_for_ok(ser, pending)
+
+        batch += data
+        pending.append(len(data))
+        buffered += len(data)
+
+    ser.write(batch)
+
+    # Wait for the remaining messages to be acknowledged
+    while pending:
+        buffered -= wait_for_ok(ser, pending)
 
 try:
     ser = serial.Serial(SERIAL_PORT, BAUD_RATE, timeout=1)
@@ -37,22 +103,13 @@ try:
     with open(GCODE_FILE, 'r') as file:
         gcode_lines = [line.strip() for line in file if line.strip() and not line.startswith(';')]
 
-    # Track the previous point
-    prev_point = (0, 0, 0)
-
-    # Send each G-code line with proportional delay
-    for gcode_line in gcode_lines:
-        ser.write((gcode_line + '\n').encode('utf-8'))
-        print(f"Sent: {gcode_line}")
-
-        # Calculate delay based on movement distance
-        current_point = extract_coordinates(gcode_line)
-        if any(coord is not None for coord in current_point):
-            distance = calculate_distance(prev_point, current_point)
-            delay = max(1, distance / 12)  # Scale delay; adjust divisor to tune speed
-            print(f"Distance: {distance:.2f}, Delay: {delay:.2f}s")
-            time.sleep(delay)
-            prev_point = current_point  # Update previous point
+    if BINARY_MODE:
+        stream(ser, [b'BINARY\n'])
+        records = pack_gcode_binary(gcode_to_cmds(gcode_lines))
+        print(f"Sending {len(records) - 1} moves in binary")
+        stream(ser, records)
+    else:
+        stream(ser, [(gcode_line + '\n').encode('utf-8') for gcode_line in gcode_lines])
 
     print("G-code file transmission complete.")
     ser.close()
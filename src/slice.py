@@ -1,15 +1,33 @@
-import matplotlib
-matplotlib.use('Agg') # comment this out if you want the cool visualization
-import matplotlib.pyplot as plt
-from matplotlib.widgets import Slider
 import math
+import threading
+from collections import deque
 from pathlib import Path
 import ezdxf
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:  # Numba is optional; the NumPy hatching kernel is used without it
+    njit = None
+
+try:
+    from _hatch import hatch as _hatch_cython  # Compiled from _hatch.pyx, see README
+except ImportError:
+    _hatch_cython = None
 
 # Print bed dimensions
 PRINT_BED_X = 500
 PRINT_BED_Y = 500
 
+# Bump whenever the generated G-code or visualization data changes. The web app puts it in its
+# cache keys, so results from an older slicer are never served as current.
+SLICER_VERSION = 2
+
+# export_visualization redraws one figure instead of building a new one per export.
+# The lock is needed because matplotlib is not thread-safe.
+_export_figure = None
+_export_lock = threading.Lock()
+
 
 def combine_segments_to_polygon(segments, tol=1e-6):
     """
@@ -26,40 +44,55 @@ def combine_segments_to_polygon(segments, tol=1e-6):
     def points_equal(p1, p2):
         return abs(p1[0] - p2[0]) < tol and abs(p1[1] - p2[1]) < tol
 
+    def key(point):
+        return round(point[0] / tol), round(point[1] / tol)
+
     if not segments:
         return []
 
-    segs = segments.copy()
+    # Map quantized endpoints to (segment index, end) where end 0 is the start and -1 the end.
+    endpoint_map = {}
+    for i, seg in enumerate(segments[1:], start=1):
+        endpoint_map.setdefault(key(seg[0]), []).append((i, 0))
+        endpoint_map.setdefault(key(seg[-1]), []).append((i, -1))
+    remaining = set(range(1, len(segments)))
+
+    def find_matches(point):
+        # Points within tol may quantize into a neighbouring cell, so check those too.
+        kx, ky = key(point)
+        for cell in ((kx + dx, ky + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)):
+            for i, end in endpoint_map.get(cell, ()):
+                if i in remaining and points_equal(point, segments[i][end]):
+                    yield i, end
+
     # Start with the first segment as the beginning of the polygon.
-    polygon = segs.pop(0)
+    # A deque so that connecting at the start doesn't shift the whole polygon.
+    polygon = deque(segments[0])
 
     # Continue connecting segments until no connecting segment is found.
-    while segs:
-        current_point = polygon[-1]  # End of current polyline
-        found = False
-        for i, seg in enumerate(segs):
-            if points_equal(current_point, seg[0]):  # Connect at start
-                polygon.extend(seg[1:])
-                found = True
-            elif points_equal(current_point, seg[-1]):  # Connect at end (reverse needed)
-                polygon.extend(reversed(seg[:-1]))
-                found = True
-            elif points_equal(polygon[0], seg[0]):  # Connect start-to-start
-                polygon = list(reversed(seg)) + polygon[1:]
-                found = True
-            elif points_equal(polygon[0], seg[-1]):  # Connect start-to-end
-                polygon = seg[:-1] + polygon
-                found = True
-
-            if found:
-                segs.pop(i)
-                break
-
-        if not found:
+    while remaining:
+        # Prefer the earliest segment, and for the same segment connect in the order:
+        # end-to-start, end-to-end, start-to-start, start-to-end.
+        candidates = [(i, 0 if end == 0 else 1) for i, end in find_matches(polygon[-1])]
+        candidates += [(i, 2 if end == 0 else 3) for i, end in find_matches(polygon[0])]
+        if not candidates:
             # No segment connects to the current endpoints; break out.
             break
 
-    return polygon
+        i, connection = min(candidates)
+        seg = segments[i]
+        if connection == 0:  # Connect at start
+            polygon.extend(seg[1:])
+        elif connection == 1:  # Connect at end (reverse needed)
+            polygon.extend(reversed(seg[:-1]))
+        elif connection == 2:  # Connect start-to-start
+            polygon.popleft()
+            polygon.extendleft(seg)  # extendleft reverses seg
+        else:  # Connect start-to-end
+            polygon.extendleft(reversed(seg[:-1]))
+        remaining.discard(i)
+
+    return list(polygon)
 
 def combine_lines_to_polygon(lines):
     """
@@ -96,15 +129,29 @@ def combine_lines_to_polygon(lines):
 
     return path
 
-def read_dxf_polygon(file_path):
+def close_polygon(points, tol=1e-6):
+    """
+    Returns the polygon points with the first point repeated exactly at the end.
+    A last point within tol of the first (e.g. from joining segments) is snapped onto it.
+    """
+    first, last = points[0], points[-1]
+    if first == last:
+        return points
+    if abs(first[0] - last[0]) < tol and abs(first[1] - last[1]) < tol:
+        return points[:-1] + [first]
+    return points + [first]
+
+def read_dxf_polygon(file_path, spline_distance=0.1):
     """
     Reads a DXF file and extracts the outer boundary polygon points.
 
     Parameters:
       file_path - Path to the DXF file.
+      spline_distance - Max distance (in DXF units) between a spline and its flattened polyline.
 
     Returns:
-      A list of points [(x, y), (x, y), ...] representing the polygon shape.
+      An (N, 2) float64 array of the polygon points.
+      The polygon is closed (first and last points identical).
     """
     doc = ezdxf.readfile(file_path)
     msp = doc.modelspace()
@@ -117,18 +164,18 @@ def read_dxf_polygon(file_path):
         if entity.dxftype() == 'LWPOLYLINE':
             points = [(point[0], point[1]) for point in entity.get_points()]
             if entity.is_closed:
-                return points
+                return np.array(close_polygon(points), dtype=np.float64)
         elif entity.dxftype() == 'POLYLINE':
             points = [(point[0], point[1]) for point in entity.points]
             if entity.is_closed:
-                return points
+                return np.array(close_polygon(points), dtype=np.float64)
         elif entity.dxftype() == 'LINE':
             points = [(entity.dxf.start.x, entity.dxf.start.y),
                       (entity.dxf.end.x, entity.dxf.end.y)]
             lines.append(points)
-        elif entity.dxftype() in 'SPLINE':
-            spline = ezdxf.math.BSpline(entity.control_points)
-            points = list(spline.flattening(distance=0.1))
+        elif entity.dxftype() == 'SPLINE':
+            # The entity's own flattening respects its degree, knots and weights
+            points = list(entity.flattening(distance=spline_distance))
             lines.append([(point[0], point[1]) for point in points])
         elif entity.dxftype() in ['CIRCLE', 'ARC']:
             points = list(entity.flattening(sagitta=0.05))
@@ -138,7 +185,7 @@ def read_dxf_polygon(file_path):
             lines.append([(point[0], point[1]) for point in points])
 
     if lines:
-        return combine_segments_to_polygon(lines)
+        return np.array(close_polygon(combine_segments_to_polygon(lines)), dtype=np.float64)
 
     raise ValueError("No valid polygon shapes found in DXF file.")
 
@@ -147,102 +194,189 @@ def scale_polygon(polygon, scale_factor):
     Scales a polygon by a given factor.
 
     Parameters:
-      polygon - List of (x, y) tuples representing the polygon points.
+      polygon - (N, 2) array of the polygon points.
       scale_factor - The factor to scale the polygon by (e.g., 25.4 for mm to in).
 
     Returns:
-      A new list of points representing the scaled polygon.
+      A new (N, 2) array of the scaled polygon points.
     """
-    return [(x * scale_factor, y * scale_factor) for x, y in polygon]
+    return polygon * scale_factor
 
 def center_polygon(polygon, bed_width, bed_height):
     """
     Centers a closed polygon on the center of the given print bed dimensions.
 
     Parameters:
-      polygon - List of (x, y) tuples representing the polygon points.
+      polygon - (N, 2) array of the polygon points.
       bed_width - Width of the print bed.
       bed_height - Height of the print bed.
 
     Returns:
-      A new list of points representing the centered polygon.
+      A new (N, 2) array of the centered polygon points.
     """
-    # Find polygon bounding box
-    min_x = min(point[0] for point in polygon)
-    max_x = max(point[0] for point in polygon)
-    min_y = min(point[1] for point in polygon)
-    max_y = max(point[1] for point in polygon)
+    # Move the center of the polygon's bounding box onto the center of the print bed
+    poly_center = (polygon.min(axis=0) + polygon.max(axis=0)) / 2
+    bed_center = np.array([bed_width / 2, bed_height / 2])
+    return polygon + (bed_center - poly_center)
 
-    # Calculate polygon's current center
-    poly_center_x = (min_x + max_x) / 2
-    poly_center_y = (min_y + max_y) / 2
+def generate_perimeter_path(polygon):
+    """
+    Converts a closed polygon into a command array representing its perimeter.
 
-    # Calculate print bed center
-    bed_center_x = bed_width / 2
-    bed_center_y = bed_height / 2
+    Parameters:
+      polygon - (N, 2) array of the polygon points.
+                The polygon should already be closed (first and last points identical).
 
-    # Calculate translation values
-    offset_x = bed_center_x - poly_center_x
-    offset_y = bed_center_y - poly_center_y
+    Returns:
+      A list of commands in the form (x, y, state)
+      where state 0 means “move to” (no extrusion) and state 1 means “draw to” (extrude).
+    """
+    points = polygon.tolist()
+    cmd_arr = [(points[0][0], points[0][1], 0)]  # Start at the first point without extruding
 
-    # Translate polygon points
-    centered_polygon = [(x + offset_x, y + offset_y) for x, y in polygon]
+    # Draw each segment
+    cmd_arr.extend((x, y, 1) for x, y in points[1:])
 
-    return centered_polygon
+    return cmd_arr
 
-def generate_perimeter_path(polygon):
+def polygon_to_edges(polygon):
     """
-    Converts a closed polygon into a command array representing its perimeter.
+    Converts a closed polygon into arrays of edge start and end points.
 
     Parameters:
-      polygon - List of (x, y) tuples representing the polygon points.
+      polygon - (N, 2) array of the polygon points.
                 The polygon should already be closed (first and last points identical).
 
     Returns:
-      A list of commands in the form (x, y, state)
-      where state 0 means “move to” (no extrusion) and state 1 means “draw to” (extrude).
+      A tuple (P1, P2) of float64 arrays of shape (N - 1, 2), where edge i runs from P1[i] to P2[i].
     """
-    # Ensure the polygon is closed
-    if polygon[0] != polygon[-1]:
-        polygon.append(polygon[0])
+    return polygon[:-1], polygon[1:]
 
-    cmd_arr = [(polygon[0][0], polygon[0][1], 0)]  # Start at the first point without extruding
+def hatch_line_values(c_min, c_max, step):
+    """
+    Returns the c-values of evenly spaced hatch lines from c_min up to (and including) c_max.
+    """
+    count = int(math.floor((c_max - c_min) / step)) + 2
+    # Accumulate the steps (rather than c_min + i*step) to land on the same values as stepping c.
+    c_values = np.add.accumulate(np.r_[c_min, np.full(count - 1, step)])
+    return c_values[c_values <= c_max]
 
-    # Iterate through the polygon points to build the path
-    for point in polygon[1:]:
-        cmd_arr.append((point[0], point[1], 1))  # Draw each segment
+def get_hatch_segments(P1, P2, A, B, c_values, epsilon=1e-6):
+    """
+    Intersects every hatch line A*x + B*y = c (one per entry of c_values) with the polygon edges
+    (see polygon_to_edges) in a single batch and pairs up the intersections.
 
-    return cmd_arr
+    Returns:
+      A tuple (starts, ends) of (K, 2) arrays. Segments are ordered by hatch line, and within a
+      line by x, with intersections paired sequentially (to handle concave regions).
+    """
+    dx = P2[:, 0] - P1[:, 0]
+    dy = P2[:, 1] - P1[:, 1]
+    denom = A * dx + B * dy
+    valid = np.abs(denom) >= epsilon  # skip edges parallel to the lines
+    P1, dx, dy, denom = P1[valid], dx[valid], dy[valid], denom[valid]
+
+    # (M lines x N edges) so that flattening keeps the per-line edge order
+    c = np.asarray(c_values, dtype=np.float64)[:, None]
+    t = -(A * P1[:, 0] + B * P1[:, 1] - c) / denom
+    line_idx, edge_idx = np.nonzero((t >= 0) & (t <= 1))
+    t = t[line_idx, edge_idx]
+    x_int = P1[edge_idx, 0] + t * dx[edge_idx]
+    y_int = P1[edge_idx, 1] + t * dy[edge_idx]
+
+    # Sort intersections along each line (using x as a proxy).
+    order = np.lexsort((x_int, line_idx))
+    line_idx, x_int, y_int = line_idx[order], x_int[order], y_int[order]
+
+    # Pair sequentially within each line; a trailing odd intersection is dropped.
+    counts = np.bincount(line_idx, minlength=len(c))
+    first = np.cumsum(counts) - counts
+    rank = np.arange(len(line_idx)) - first[line_idx]
+    is_start = (rank % 2 == 0) & (rank + 1 < counts[line_idx])
+    starts = np.flatnonzero(is_start)
+    ends = starts + 1
+    return (np.column_stack((x_int[starts], y_int[starts])),
+            np.column_stack((x_int[ends], y_int[ends])))
+
+def _hatch(P1x, P1y, P2x, P2y, A, B, c_values, epsilon):
+    """
+    Loop version of get_hatch_segments, compiled with Numba when it is installed.
+
+    Returns:
+      A (K, 4) array of segments (x_start, y_start, x_end, y_end) in the same order as
+      get_hatch_segments.
+    """
+    n = P1x.shape[0]
+    m = c_values.shape[0]
+    dx = P2x - P1x
+    dy = P2y - P1y
+    denom = A * dx + B * dy
+
+    # First pass: count intersections to size the output buffer.
+    total = 0
+    for j in range(m):
+        for i in range(n):
+            if abs(denom[i]) < epsilon:
+                continue  # edge is parallel to the line
+            t = -(A * P1x[i] + B * P1y[i] - c_values[j]) / denom[i]
+            if 0 <= t <= 1:
+                total += 1
+
+    out = np.empty((total // 2, 4))
+    xs = np.empty(n)
+    ys = np.empty(n)
+    count = 0
+    for j in range(m):
+        k = 0
+        for i in range(n):
+            if abs(denom[i]) < epsilon:
+                continue
+            t = -(A * P1x[i] + B * P1y[i] - c_values[j]) / denom[i]
+            if 0 <= t <= 1:
+                # Insertion sort by x as we go (stable, N is small).
+                x = P1x[i] + t * dx[i]
+                y = P1y[i] + t * dy[i]
+                pos = k
+                while pos > 0 and xs[pos - 1] > x:
+                    xs[pos] = xs[pos - 1]
+                    ys[pos] = ys[pos - 1]
+                    pos -= 1
+                xs[pos] = x
+                ys[pos] = y
+                k += 1
+        for i in range(0, k - 1, 2):
+            out[count, 0] = xs[i]
+            out[count, 1] = ys[i]
+            out[count, 2] = xs[i + 1]
+            out[count, 3] = ys[i + 1]
+            count += 1
+    return out[:count]
+
+if njit is not None:
+    _hatch = njit(cache=True)(_hatch)
+
+def hatch_segments(P1, P2, A, B, c_values, epsilon=1e-6):
+    """
+    Runs the fastest available hatching kernel: the compiled Cython extension, then the Numba JIT,
+    then the NumPy get_hatch_segments. All three return the same segments in the same order.
 
-def get_line_polygon_intersections(polygon, A, B, C, epsilon=1e-6):
-    """
-    Given a line in the form A*x + B*y + C = 0 and a polygon (list of (x, y) tuples),
-    return a list of intersection points (x, y) between the line and the polygon’s edges.
-    """
-    intersections = []
-    n = len(polygon)
-    for i in range(n):
-        p1 = polygon[i]
-        p2 = polygon[(i + 1) % n]  # ensure closed polygon
-        dx = p2[0] - p1[0]
-        dy = p2[1] - p1[1]
-        denom = A * dx + B * dy
-        if abs(denom) < epsilon:
-            continue  # edge is parallel to the line
-        t = -(A * p1[0] + B * p1[1] + C) / denom
-        if 0 <= t <= 1:
-            x_int = p1[0] + t * dx
-            y_int = p1[1] + t * dy
-            intersections.append((x_int, y_int))
-    return intersections
+    Returns:
+      A tuple (starts, ends) of (K, 2) arrays.
+    """
+    if _hatch_cython is not None or njit is not None:
+        kernel = _hatch_cython if _hatch_cython is not None else _hatch
+        edges = [np.ascontiguousarray(a) for a in (P1[:, 0], P1[:, 1], P2[:, 0], P2[:, 1])]
+        segments = kernel(*edges, float(A), float(B), np.ascontiguousarray(c_values, dtype=np.float64), epsilon)
+        return segments[:, :2], segments[:, 2:]
+    return get_hatch_segments(P1, P2, A, B, c_values, epsilon)
 
 def generate_cross_hatching_path(polygon, spacing):
     """
     Generate a cross-hatching pattern for a closed polygon.
 
     Parameters:
-      polygon - a list of (x, y) tuples defining a closed path (the first and last point
-                should be the same; if not, the function will close it automatically)
+      polygon - an (N, 2) array defining a closed path (the first and last point
+                should be the same, as returned by read_dxf_polygon)
       spacing - the perpendicular distance between hatch lines.
 
     Returns:
@@ -258,72 +392,94 @@ def generate_cross_hatching_path(polygon, spacing):
     For each hatch line the intersections with the polygon are computed and sorted, and pairs
     of intersections are used as start/end points for drawing.
     """
-    # Ensure the polygon is closed.
-    if polygon[0] != polygon[-1]:
-        polygon = polygon + [polygon[0]]
-
     cmd_arr = []
-
-    # --- Hatch set 1: lines of slope -1 (x + y = c) ---
-    # Determine the range of c-values from the polygon vertices.
-    c_values = [pt[0] + pt[1] for pt in polygon]
-    c_min = min(c_values)
-    c_max = max(c_values)
-    # The perpendicular distance between lines y = -x + c is |delta_c|/√2.
+    P1, P2 = polygon_to_edges(polygon)
+    # The perpendicular distance between lines y = ±x + c is |delta_c|/√2.
     # To have a spacing of "spacing" we step by spacing*√2.
     step = spacing * math.sqrt(2)
 
-    c = c_min
-    while c <= c_max:
-        # For the line x+y = c, we use A = 1, B = 1, C = -c.
-        intersections = get_line_polygon_intersections(polygon, 1, 1, -c)
-        if len(intersections) >= 2:
-            # Sort intersections along the line (using x as a proxy).
-            intersections.sort(key=lambda p: p[0])
-            # For multiple intersections (in concave regions) pair them sequentially.
-            for i in range(0, len(intersections) - 1, 2):
-                start = intersections[i]
-                end = intersections[i + 1]
-                cmd_arr.append((start[0], start[1], 0))  # move without extruding
-                cmd_arr.append((end[0], end[1], 1))      # draw (extrude)
-        c += step
-
-    # --- Hatch set 2: lines of slope 1 (y - x = c) ---
-    c_values2 = [pt[1] - pt[0] for pt in polygon]
-    c_min2 = min(c_values2)
-    c_max2 = max(c_values2)
-
-    c = c_min2
-    while c <= c_max2:
-        # For the line y - x = c, rewrite as -x + y = c; use A = -1, B = 1, C = -c.
-        intersections = get_line_polygon_intersections(polygon, -1, 1, -c)
-        if len(intersections) >= 2:
-            intersections.sort(key=lambda p: p[0])
-            for i in range(0, len(intersections) - 1, 2):
-                start = intersections[i]
-                end = intersections[i + 1]
-                cmd_arr.append((start[0], start[1], 0))
-                cmd_arr.append((end[0], end[1], 1))
-        c += step
+    # --- Hatch set 1: lines of slope -1 (x + y = c), A = 1, B = 1 ---
+    # --- Hatch set 2: lines of slope 1 (y - x = c), A = -1, B = 1 ---
+    for A, B in ((1, 1), (-1, 1)):
+        # Determine the range of c-values from the polygon vertices.
+        c_values = A * P1[:, 0] + B * P1[:, 1]
+        c_lines = hatch_line_values(c_values.min(), c_values.max(), step)
+        starts, ends = hatch_segments(P1, P2, A, B, c_lines)
+        for (x0, y0), (x1, y1) in zip(starts.tolist(), ends.tolist()):
+            cmd_arr.append((x0, y0, 0))  # move without extruding
+            cmd_arr.append((x1, y1, 1))  # draw (extrude)
 
     return cmd_arr
 
 def convert_to_gcode(coordinates):
-    commands = []
-    prev_x, prev_y, prev_e = coordinates[0]
-    commands.append(f'G1 X{prev_x:.2f} Y{prev_y:.2f}')  # Initial travel move
+    """
+    Converts a command array [(x, y, state), ...] into a list of G1 G-code lines.
+    Extrusion moves get an E value proportional to the distance from the previous point.
+    """
+    coords = np.asarray(coordinates, dtype=np.float64)
+    x, y = coords[:, 0], coords[:, 1]
+
+    # Distances between consecutive points in one pass
+    dx, dy = np.diff(x), np.diff(y)
+    extrude_amount = np.zeros(len(coords))
+    extrude_amount[1:] = np.sqrt(dx * dx + dy * dy) / 10
+
+    extrude = coords[:, 2] != 0
+    extrude[0] = False  # Initial travel move
+
+    return [f'G1 X{x:.2f} Y{y:.2f} E{e:.2f}' if is_extrude else f'G1 X{x:.2f} Y{y:.2f}'
+            for x, y, e, is_extrude in zip(x.tolist(), y.tolist(), extrude_amount.tolist(), extrude.tolist())]
+
+def split_tool_path(cmds):
+    """
+    Splits a command array into extrusion and travel polylines, with None separating disconnected runs.
+
+    Parameters:
+      cmds - A list of commands in the form (x, y, state).
+
+    Returns:
+      (extrusion_x, extrusion_y, travel_x, travel_y, extrusion_len, travel_len), where
+      extrusion_len[i] and travel_len[i] are how many points of each polyline belong to
+      the path up to and including cmds[i].
+    """
+    extrusion_x, extrusion_y = [], []
+    travel_x, travel_y = [], []
+    extrusion_len, travel_len = [], []
 
-    for x, y, e in coordinates[1:]:
-        dist = math.sqrt((x - prev_x)**2 + (y - prev_y)**2)
+    prev_x, prev_y, prev_e = cmds[0]
+    prev_type = 0 # 0 for travel, 1 for extrude
+
+    for x, y, e in cmds:
         if e == 0:
-            commands.append(f'G1 X{x:.2f} Y{y:.2f}')  # Travel move
+            if prev_type == 1: # if was previously extrude
+                extrusion_x.append(None)
+                extrusion_y.append(None)
+                travel_x.append(prev_x)
+                travel_y.append(prev_y)
+            travel_x.append(x)
+            travel_y.append(y)
+            prev_type = 0
         else:
-            commands.append(f'G1 X{x:.2f} Y{y:.2f} E{dist / 10:.2f}')  # Extrusion move with E value
+            if prev_type == 0:
+                travel_x.append(None)
+                travel_y.append(None)
+                extrusion_x.append(prev_x)
+                extrusion_y.append(prev_y)
+            extrusion_x.append(x)
+            extrusion_y.append(y)
+            prev_type = 1
+
         prev_x, prev_y = x, y
+        extrusion_len.append(len(extrusion_x))
+        travel_len.append(len(travel_x))
 
-    return commands
+    return extrusion_x, extrusion_y, travel_x, travel_y, extrusion_len, travel_len
 
 def visualize_interactive(cmds):
+    # matplotlib is imported on first use so that just generating G-code doesn't pay for it
+    import matplotlib.pyplot as plt
+    from matplotlib.widgets import Slider
+
     fig, ax = plt.subplots(figsize=(6, 6))
     ax.set_aspect('equal', adjustable='box')
 
@@ -337,40 +493,19 @@ def visualize_interactive(cmds):
 
     frame = len(cmds) - 1  # Start at the end of the operation
 
+    # Split the whole path into extrusion/travel polylines once, recording how much of each
+    # belongs to every step, so scrubbing only has to slice them.
+    extrusion_x, extrusion_y, travel_x, travel_y, extrusion_len, travel_len = split_tool_path(cmds)
+
+    # Float arrays (None becomes NaN, which still breaks the line) so slices are views, not copies
+    extrusion_x, extrusion_y = np.array(extrusion_x, dtype=float), np.array(extrusion_y, dtype=float)
+    travel_x, travel_y = np.array(travel_x, dtype=float), np.array(travel_y, dtype=float)
+
     def update(frame):
-        extrusion_x, extrusion_y = [], []
-        travel_x, travel_y = [], []
-
-        curr_cmds = cmds[:frame + 1]
-
-        prev_x, prev_y, prev_e = curr_cmds[0]
-        curr_x, curr_y, curr_e = curr_cmds[-1]
-        prev_type = 0 # 0 for travel, 1 for extrude
-
-        for x, y, e in curr_cmds:
-            if e == 0:
-                if prev_type == 1: # if was previously extrude
-                    extrusion_x.append(None)
-                    extrusion_y.append(None)
-                    travel_x.append(prev_x)
-                    travel_y.append(prev_y)
-                travel_x.append(x)
-                travel_y.append(y)
-                prev_type = 0
-            else:
-                if prev_type == 0:
-                    travel_x.append(None)
-                    travel_y.append(None)
-                    extrusion_x.append(prev_x)
-                    extrusion_y.append(prev_y)
-                extrusion_x.append(x)
-                extrusion_y.append(y)
-                prev_type = 1
-
-            prev_x, prev_y = x, y
+        curr_x, curr_y, curr_e = cmds[frame]
 
-        extrusion_lines.set_data(extrusion_x, extrusion_y)
-        travel_lines.set_data(travel_x, travel_y)
+        extrusion_lines.set_data(extrusion_x[:extrusion_len[frame]], extrusion_y[:extrusion_len[frame]])
+        travel_lines.set_data(travel_x[:travel_len[frame]], travel_y[:travel_len[frame]])
         extruder_dot.set_data([curr_x], [curr_y])
 
         print(f"G1 X{curr_x} Y{curr_y} E{curr_e}")
@@ -402,64 +537,110 @@ def visualize_interactive(cmds):
     plt.title("Diagonal Cross-Hatching Animation")
     plt.show()
 
-def export_visualization(cmds, output_image_path):
-    fig, ax = plt.subplots(figsize=(6, 6))
-    ax.set_aspect('equal', adjustable='box')
+def _get_export_figure():
+    """
+    Returns the (fig, extrusion_lines, travel_lines, extruder_dot) reused by export_visualization,
+    creating it on first use. The figure is not registered with pyplot, so plt.show() won't open it.
+    """
+    global _export_figure
+    if _export_figure is None:
+        from matplotlib.figure import Figure  # Imported on first use, see visualize_interactive
 
-    extrusion_lines, = ax.plot([], [], 'b-', lw=2)
-    travel_lines, = ax.plot([], [], 'g--', linewidth=1)
-    extruder_dot, = ax.plot([], [], 'ro')  # Red dot for extruder head
+        fig = Figure(figsize=(6, 6))
+        ax = fig.add_subplot()
+        ax.set_aspect('equal', adjustable='box')
 
-    extrusion_x, extrusion_y = [], []
-    travel_x, travel_y = [], []
+        extrusion_lines, = ax.plot([], [], 'b-', lw=2)
+        travel_lines, = ax.plot([], [], 'g--', linewidth=1)
+        extruder_dot, = ax.plot([], [], 'ro')  # Red dot for extruder head
 
-    prev_x, prev_y, prev_e = cmds[0]
+        ax.set_xlim(0, PRINT_BED_X)
+        ax.set_ylim(0, PRINT_BED_Y)
+        _export_figure = (fig, extrusion_lines, travel_lines, extruder_dot)
+    return _export_figure
+
+def export_visualization(cmds, output_image_path):
+    """
+    Renders the tool path to a PNG. Only slice_dxf uses this; the web app draws the
+    path in the browser from serialize_visualization instead.
+    """
+    extrusion_x, extrusion_y, travel_x, travel_y, _, _ = split_tool_path(cmds)
     curr_x, curr_y, curr_e = cmds[-1]
-    prev_type = 0 # 0 for travel, 1 for extrude
 
-    for x, y, e in cmds:
-        if e == 0:
-            if prev_type == 1: # if was previously extrude
-                extrusion_x.append(None)
-                extrusion_y.append(None)
-                travel_x.append(prev_x)
-                travel_y.append(prev_y)
-            travel_x.append(x)
-            travel_y.append(y)
-            prev_type = 0
-        else:
-            if prev_type == 0:
-                travel_x.append(None)
-                travel_y.append(None)
-                extrusion_x.append(prev_x)
-                extrusion_y.append(prev_y)
-            extrusion_x.append(x)
-            extrusion_y.append(y)
-            prev_type = 1
+    with _export_lock:
+        fig, extrusion_lines, travel_lines, extruder_dot = _get_export_figure()
+        extrusion_lines.set_data(extrusion_x, extrusion_y)
+        travel_lines.set_data(travel_x, travel_y)
+        extruder_dot.set_data([curr_x], [curr_y])
+        # Skip the tight bounding box pass and use fast PNG compression; this is just a preview
+        fig.savefig(output_image_path, dpi=72, bbox_inches=None, pil_kwargs={'compress_level': 1})
 
-        prev_x, prev_y = x, y
+def serialize_visualization(cmds):
+    """
+    Splits a command array into extrusion and travel polylines for rendering in the browser.
 
-    extrusion_lines.set_data(extrusion_x, extrusion_y)
-    travel_lines.set_data(travel_x, travel_y)
-    extruder_dot.set_data([curr_x], [curr_y])
+    Parameters:
+      cmds - A list of commands in the form (x, y, state).
 
-    ax.set_xlim(0, PRINT_BED_X)
-    ax.set_ylim(0, PRINT_BED_Y)
-    plt.savefig(output_image_path)
-    plt.close()
+    Returns:
+      A JSON-serializable dict {"extrusion": {"x": [...], "y": [...]}, "travel": {...},
+      "head": {...}, "bed": {...}} where None separates disconnected runs.
+    """
+    cmds = [(round(x, 2), round(y, 2), e) for x, y, e in cmds]  # G-code precision; keeps the payload small
+    extrusion_x, extrusion_y, travel_x, travel_y, _, _ = split_tool_path(cmds)
+    curr_x, curr_y, curr_e = cmds[-1]
+
+    return {
+        "extrusion": {"x": extrusion_x, "y": extrusion_y},
+        "travel": {"x": travel_x, "y": travel_y},
+        "head": {"x": [curr_x], "y": [curr_y]},
+        "bed": {"x": PRINT_BED_X, "y": PRINT_BED_Y},
+    }
+
+def generate_slice_path(file_path, spacing=10, progress=None):
+    """
+    Reads a DXF file and generates the command array (perimeter then cross-hatching) to print it.
+
+    progress - Optional callable progress(stage, pct) called as each stage of the pipeline
+               ('read_dxf', 'center', 'hatch') finishes.
+    """
+    if progress is None:
+        progress = lambda stage, pct: None
 
-def slice_dxf(file_path, spacing=10, output_image_path='visualization.png', debug=False):
     path = (Path(__file__).parent / file_path).resolve()
     if not path.exists() or path.suffix.lower() != '.dxf':
         raise FileNotFoundError(f"Invalid DXF file: {path}")
 
 
-    polygon = scale_polygon(read_dxf_polygon(path), 2)
+    scale = 2
+    # Splines only need to be as precise as the hatching, which saves edges in every later stage
+    spline_distance = max(spacing / 4 / scale, 0.1)
+    polygon = scale_polygon(read_dxf_polygon(path, spline_distance), scale)
+    progress('read_dxf', 20)
     shape = center_polygon(polygon, PRINT_BED_X, PRINT_BED_Y)
+    progress('center', 30)
     cmd_arr = generate_perimeter_path(shape)
     cmd_arr.extend(generate_cross_hatching_path(shape, spacing))
+    progress('hatch', 60)
+
+    return cmd_arr
+
+def slice_dxf(file_path, spacing=10, output_image_path='visualization.png', debug=False, progress=None):
+    """
+    Slices a DXF file into G-code and renders (or, with debug, shows) the tool path.
+    This is the command-line entry point; the web app calls generate_slice_path,
+    convert_to_gcode and serialize_visualization directly.
+
+    progress - Optional callable progress(stage, pct) called as each stage of the pipeline
+               ('read_dxf', 'center', 'hatch', 'gcode') finishes.
+    """
+    if progress is None:
+        progress = lambda stage, pct: None
+
+    cmd_arr = generate_slice_path(file_path, spacing, progress)
 
     gcode = convert_to_gcode(cmd_arr)
+    progress('gcode', 80)
 
     if debug:
         visualize_interactive(cmd_arr)
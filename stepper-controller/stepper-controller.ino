@@ -18,6 +18,30 @@ AccelStepper stepperY(AccelStepper::DRIVER, STEP_PIN_Y, DIR_PIN_Y);
 TMC2209Stepper driverX = TMC2209Stepper(EN_PIN, DIR_PIN_X, STEP_PIN_X, R_SENSE);
 TMC2209Stepper driverY = TMC2209Stepper(EN_PIN, DIR_PIN_Y, STEP_PIN_Y, R_SENSE);
 
+// Queue of pending G1 moves so the host can stream ahead of the motors.
+// Each received line is acknowledged with "ok" once it has been taken out of the serial buffer.
+#define MOVE_QUEUE_SIZE 16
+
+struct Move {
+    long x;
+    long y;
+    float feedrate;
+};
+
+Move moveQueue[MOVE_QUEUE_SIZE];
+int queueHead = 0;  // Next move to execute
+int queueCount = 0;
+
+// Binary move streaming, entered with the BINARY command.
+// Each record is 9 bytes: flags, then x and y in steps as little-endian int32.
+// Records are acknowledged with "ok" like text lines; a record with BINARY_FLAG_END returns to text mode.
+#define BINARY_RECORD_SIZE 9
+#define BINARY_FLAG_EXTRUDE 0x01
+#define BINARY_FLAG_END 0x80
+#define DEFAULT_FEEDRATE 100.0
+
+bool binaryMode = false;
+
 void setup() {
     Serial.begin(115200); // Serial monitor for G-code input
 
@@ -45,7 +69,13 @@ void setup() {
 }
 
 void loop() {
-    if (Serial.available()) {
+    // Only read the next line/record when there is room to queue it; otherwise it waits in the serial buffer
+    if (binaryMode) {
+        if (Serial.available() >= BINARY_RECORD_SIZE && queueCount < MOVE_QUEUE_SIZE) {
+            processBinaryRecord();
+            Serial.println("ok");
+        }
+    } else if (Serial.available() && queueCount < MOVE_QUEUE_SIZE) {
         String input = Serial.readStringUntil('\n');
         input.trim();
 
@@ -58,9 +88,23 @@ void loop() {
             testStepper(stepperY, "Y");
         } else if (input == "LIMIT") {
             checkLimitSwitches();
+        } else if (input == "BINARY") {
+            binaryMode = true;
         } else {
             processGCode(input);
         }
+        Serial.println("ok");
+    }
+
+    // Start the next queued move once the current one is finished
+    if (queueCount > 0 && stepperX.distanceToGo() == 0 && stepperY.distanceToGo() == 0) {
+        Move &move = moveQueue[queueHead];
+        stepperX.moveTo(move.x);
+        stepperY.moveTo(move.y);
+        stepperX.setSpeed(move.feedrate);
+        stepperY.setSpeed(move.feedrate);
+        queueHead = (queueHead + 1) % MOVE_QUEUE_SIZE;
+        queueCount--;
     }
 
     stepperX.run();
@@ -90,10 +134,34 @@ void calibrateX() {
 }
 
 
+void queueMove(long x, long y, float feedrate) {
+    Move &move = moveQueue[(queueHead + queueCount) % MOVE_QUEUE_SIZE];
+    move.x = x;
+    move.y = y;
+    move.feedrate = feedrate;
+    queueCount++;
+}
+
+void processBinaryRecord() {
+    byte record[BINARY_RECORD_SIZE];
+    Serial.readBytes(record, BINARY_RECORD_SIZE);
+
+    byte flags = record[0];
+    if (flags & BINARY_FLAG_END) {
+        binaryMode = false;
+        return;
+    }
+
+    int32_t x, y;
+    memcpy(&x, record + 1, sizeof(x)); // AVR is little-endian, same as the wire format
+    memcpy(&y, record + 5, sizeof(y));
+    queueMove(x, y, DEFAULT_FEEDRATE);
+}
+
 void processGCode(String gcode) {
     gcode.trim();
     if (gcode.startsWith("G1")) { // G1 for coordinated linear move
-        float x = 0.0, y = 0.0, feedrate = 100.0;
+        float x = 0.0, y = 0.0, feedrate = DEFAULT_FEEDRATE;
 
         if (gcode.indexOf('X') != -1) {
             x = gcode.substring(gcode.indexOf('X') + 1).toFloat();
@@ -105,10 +173,7 @@ void processGCode(String gcode) {
             feedrate = gcode.substring(gcode.indexOf('F') + 1).toFloat();
         }
 
-        stepperX.moveTo(x * 100); // Convert mm to steps (adjust scaling if needed)
-        stepperY.moveTo(y * 100);
-        stepperX.setSpeed(feedrate);
-        stepperY.setSpeed(feedrate);
+        queueMove(x * 100, y * 100, feedrate); // Convert mm to steps (adjust scaling if needed)
     }
 }
 